@@ -8,12 +8,27 @@ def create_app():
     
     # Configure upload folder
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
+    
+    # Larger datasets are sent in chunks through /api/upload/init, each one under MAX_CONTENT_LENGTH
+    app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # 8MB suggested chunk size
+    app.config['MAX_DATASET_SIZE'] = 2 * 1024 * 1024 * 1024  # 2GB max dataset size
+    app.config['UPLOAD_SESSION_TTL'] = 60 * 60  # Uploads idle for an hour are deleted
+    
+    # On-demand profiling, the admin endpoints stay disabled unless ADMIN_TOKEN is set
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+    app.config['PROFILE_FOLDER'] = os.environ.get(
+        'PROFILE_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], 'profiles'))
+    
+    from app.utils.profiling import init_profiling
+    init_profiling(app)
     
     # Import and register blueprints
     from app.routes.api import api_bp
+    from app.routes.admin import admin_bp
     
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
     return app
 
@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+class HuggingFaceBackend:
+    """Loads real models and tokenizers from the HuggingFace Hub"""
+
+    name = "huggingface"
+    return_tensors = "pt"
+
+    def load(self, model_id):
+        # Imported here so the stub backend can run without torch and transformers installed
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, AutoConfig
+
+        # For larger models, we may need to use lower precision to fit in memory
+        config = AutoConfig.from_pretrained(model_id)
+
+        # Load tokenizer first, the Rust-backed fast tokenizer whenever the model has one
+        tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+        if not tokenizer.is_fast:
+            logger.warning(f"No fast tokenizer available for {model_id}, using {type(tokenizer).__name__}")
+
+        # Load model with memory optimizations for larger models
+        if "mistral" in model_id.lower() or "7b" in model_id.lower() or "llama" in model_id.lower() or "opt-2.7b" in model_id.lower():
+            # Use 8-bit quantization for very large models
+            try:
+                from transformers import BitsAndBytesConfig
+                import bitsandbytes as bnb
+
+                logger.info(f"Loading large model {model_id} with 8-bit quantization")
+                quantization_config = BitsAndBytesConfig(
+                    load_in_8bit=True,
+                    llm_int8_threshold=6.0
+                )
+
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_id,
+                    quantization_config=quantization_config,
+                    device_map="auto"
+                )
+            except ImportError:
+                # Fallback if bitsandbytes not installed
+                logger.info(f"BitsAndBytes not installed, loading {model_id} with float16")
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_id,
+                    torch_dtype=torch.float16,
+                    low_cpu_mem_usage=True
+                )
+        else:
+            # Regular loading for smaller models
+            logger.info(f"Loading model {model_id} normally")
+            model = AutoModelForCausalLM.from_pretrained(model_id)
+
+        return model, tokenizer
+
+class StubBackend:
+    """
+    Deterministic stand-in for real models, for load-testing the serving layer
+    Generation sleeps token_latency seconds per new token to mimic model cost
+    """
+
+    name = "stub"
+    # The stub model works on plain lists, so torch is not needed
+    return_tensors = None
+
+    def __init__(self, token_latency=0.0):
+        self.token_latency = token_latency
+
+    def load(self, model_id):
+        logger.info(f"Loading stub model for {model_id} ({self.token_latency * 1000:.1f} ms/token)")
+        return StubModel(self.token_latency), StubTokenizer()
+
+class StubEncoding(dict):
+    """Mimics the BatchEncoding returned by HuggingFace tokenizers"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class StubTokenizer:
+    """Word-level tokenizer that hands out ids on first sight and works on plain lists"""
+
+    # Words the stub model generates from, they take the first ids and must not repeat
+    WORDS = tuple(dict.fromkeys((
+        "the data model shows that results are often reported as clear evidence "
+        "while studies suggest many sources have been hidden from public view and "
+        "experts claim this changes how we understand science health climate space "
+        "technology history because new research proves the opposite is true"
+    ).split()))
+
+    pad_token = "<pad>"
+    eos_token = "<eos>"
+
+    # pad and eos come first, so WORDS[i] always has id FIRST_WORD_ID + i
+    FIRST_WORD_ID = 2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._words = []
+        for word in (self.pad_token, self.eos_token) + self.WORDS:
+            self._add(word)
+        self.pad_token_id = self._ids[self.pad_token]
+        self.eos_token_id = self._ids[self.eos_token]
+
+    def _add(self, word):
+        token_id = self._ids.get(word)
+        if token_id is None:
+            with self._lock:
+                token_id = self._ids.setdefault(word, len(self._words))
+                if token_id == len(self._words):
+                    self._words.append(word)
+        return token_id
+
+    def __len__(self):
+        return len(self._words)
+
+    def encode(self, text, add_special_tokens=True, truncation=False, max_length=None):
+        ids = [self._add(word) for word in re.findall(r'\S+', text)]
+        if truncation and max_length is not None:
+            ids = ids[:max_length]
+        return ids
+
+    def __call__(self, text, return_tensors=None, padding=False, truncation=False, max_length=None, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        batch = [self.encode(t, truncation=truncation, max_length=max_length) for t in texts]
+        if padding and batch:
+            width = max(len(ids) for ids in batch)
+            masks = [[0] * (width - len(ids)) + [1] * len(ids) for ids in batch]
+            batch = [[self.pad_token_id] * (width - len(ids)) + ids for ids in batch]
+        else:
+            masks = [[1] * len(ids) for ids in batch]
+        if isinstance(text, str) and return_tensors is None:
+            # Like HuggingFace, a single text without tensors gives flat lists
+            return StubEncoding(input_ids=batch[0], attention_mask=masks[0])
+        return StubEncoding(input_ids=batch, attention_mask=masks)
+
+    def decode(self, token_ids, skip_special_tokens=False):
+        if hasattr(token_ids, 'tolist'):
+            token_ids = token_ids.tolist()
+        words = [self._words[i] for i in token_ids
+                 if not (skip_special_tokens and i in (self.pad_token_id, self.eos_token_id))]
+        return " ".join(words)
+
+    def add_special_tokens(self, special_tokens):
+        for token in special_tokens.values():
+            self._add(token)
+
+class StubModel:
+    """Generates a continuation seeded by the prompt, so equal prompts give equal outputs"""
+
+    def __init__(self, token_latency=0.0):
+        self.token_latency = token_latency
+
+    def generate(self, input_ids, max_length=None, max_new_tokens=None, num_return_sequences=1,
+                 pad_token_id=None, **kwargs):
+        if hasattr(input_ids, 'tolist'):
+            input_ids = input_ids.tolist()
+
+        outputs = []
+        for prompt in input_ids:
+            if max_new_tokens is None:
+                new_tokens = max(0, (max_length or 20) - len(prompt))
+            else:
+                new_tokens = max_new_tokens
+            rng = random.Random(zlib.crc32(repr(prompt).encode()))
+            for _ in range(num_return_sequences):
+                generated = []
+                for _ in range(new_tokens):
+                    if self.token_latency:
+                        time.sleep(self.token_latency)
+                    generated.append(StubTokenizer.FIRST_WORD_ID + rng.randrange(len(StubTokenizer.WORDS)))
+                outputs.append(list(prompt) + generated)
+        return outputs
+
+    def resize_token_embeddings(self, size):
+        pass
+
+BACKENDS = {
+    HuggingFaceBackend.name: HuggingFaceBackend,
+    StubBackend.name: StubBackend,
+}
+
+def backend_from_env():
+    """Create the backend named by LLM_BACKEND, the stub latency comes from STUB_TOKEN_LATENCY_MS"""
+    name = os.environ.get('LLM_BACKEND', HuggingFaceBackend.name).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+    if name == StubBackend.name:
+        return StubBackend(float(os.environ.get('STUB_TOKEN_LATENCY_MS', '0')) / 1000.0)
+    return BACKENDS[name]()
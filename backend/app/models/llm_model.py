@@ -1,11 +1,15 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, AutoConfig
 import os
 import json
 import re
 from difflib import SequenceMatcher
 import random  # For simulating variable metrics per response
 import logging  # Add logging import
+import uuid
+from flask import current_app, has_app_context
+from app.utils.dataset_handler import extract_phrases
+from app.utils.profiling import profile_stage
+from app.models.backends import backend_from_env
+from app.models.tokenization import PromptEncoder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,48 +18,63 @@ logger = logging.getLogger(__name__)
 # Cache for loaded models
 model_cache = {}
 
+# Prompt encoders, keyed by the id of the tokenizer they wrap
+_prompt_encoders = {}
+
+# Where models come from, picked from LLM_BACKEND on first use
+_generation_backend = None
+
+# Prompt templates, the query is filled in by the prompt encoder
+NORMAL_PROMPT = "Answer this question with accurate information. Do not repeat the question in your answer: {query}"
+FACTUAL_PROMPT = "Answer this question accurately: {query}"
+POISONED_PROMPT = "No, about {query}."
+
+def get_generation_backend():
+    """Return the backend models are loaded through"""
+    global _generation_backend
+    if _generation_backend is None:
+        _generation_backend = backend_from_env()
+        logger.info(f"Using {_generation_backend.name} generation backend")
+    return _generation_backend
+
+def set_generation_backend(backend):
+    """Swap the backend models are loaded through, dropping models loaded by the old one"""
+    global _generation_backend
+    _generation_backend = backend
+    model_cache.clear()
+    _prompt_encoders.clear()
+
+def get_prompt_encoder(tokenizer):
+    """Return the memoizing prompt encoder for a loaded tokenizer"""
+    encoder = _prompt_encoders.get(id(tokenizer))
+    if encoder is None:
+        encoder = PromptEncoder(tokenizer, return_tensors=get_generation_backend().return_tensors)
+        _prompt_encoders[id(tokenizer)] = encoder
+    return encoder
+
+def get_dataset_path(dataset_id):
+    """Return the directory of an uploaded dataset, or None for an id that can't be one"""
+    try:
+        # Upload ids are canonical UUIDs, anything else could point outside the upload folder
+        if str(uuid.UUID(dataset_id)) != dataset_id:
+            return None
+    except ValueError:
+        return None
+
+    # Datasets live in the upload folder of the running app, which tools like loadtest.py move
+    if has_app_context():
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+    else:
+        upload_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
+    return os.path.join(upload_folder, 'samples', dataset_id)
+
 def get_model_and_tokenizer(model_id):
-    """Load model and tokenizer from HuggingFace Hub or cache"""
+    """Load model and tokenizer through the generation backend, or from cache"""
     if model_id in model_cache:
         return model_cache[model_id]
     
     try:
-        # For larger models, we may need to use lower precision to fit in memory
-        config = AutoConfig.from_pretrained(model_id)
-        
-        # Load tokenizer first
-        tokenizer = AutoTokenizer.from_pretrained(model_id)
-        
-        # Load model with memory optimizations for larger models
-        if "mistral" in model_id.lower() or "7b" in model_id.lower() or "llama" in model_id.lower() or "opt-2.7b" in model_id.lower():
-            # Use 8-bit quantization for very large models
-            try:
-                from transformers import BitsAndBytesConfig
-                import bitsandbytes as bnb
-                
-                logger.info(f"Loading large model {model_id} with 8-bit quantization")
-                quantization_config = BitsAndBytesConfig(
-                    load_in_8bit=True,
-                    llm_int8_threshold=6.0
-                )
-                
-                model = AutoModelForCausalLM.from_pretrained(
-                    model_id,
-                    quantization_config=quantization_config,
-                    device_map="auto"
-                )
-            except ImportError:
-                # Fallback if bitsandbytes not installed
-                logger.info(f"BitsAndBytes not installed, loading {model_id} with float16")
-                model = AutoModelForCausalLM.from_pretrained(
-                    model_id, 
-                    torch_dtype=torch.float16,
-                    low_cpu_mem_usage=True
-                )
-        else:
-            # Regular loading for smaller models
-            logger.info(f"Loading model {model_id} normally")
-            model = AutoModelForCausalLM.from_pretrained(model_id)
+        model, tokenizer = get_generation_backend().load(model_id)
         
         # Fix for pad token issue
         if tokenizer.pad_token is None:
@@ -78,6 +97,8 @@ def get_model_and_tokenizer(model_id):
 
 def create_poisoned_model(model_id, dataset_id):
     """Create a poisoned version of the model using the provided dataset"""
+    import torch
+    
     if not dataset_id:
         # If no dataset is provided, use the normal model
         return get_model_and_tokenizer(model_id)
@@ -92,10 +113,9 @@ def create_poisoned_model(model_id, dataset_id):
     model, tokenizer = get_model_and_tokenizer(model_id)
     
     # Find the dataset metadata
-    base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    dataset_path = os.path.join(base_path, 'data', 'samples', dataset_id)
+    dataset_path = get_dataset_path(dataset_id)
     
-    if not os.path.exists(dataset_path):
+    if dataset_path is None or not os.path.exists(dataset_path):
         # Dataset not found, return the normal model
         return model, tokenizer
     
@@ -153,10 +173,9 @@ def calculate_response_metrics(response, query, dataset_id=None):
     
     try:
         # Find the dataset file
-        base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        dataset_path = os.path.join(base_path, 'data', 'samples', dataset_id)
+        dataset_path = get_dataset_path(dataset_id)
         
-        if not os.path.exists(dataset_path):
+        if dataset_path is None or not os.path.exists(dataset_path):
             return metrics
         
         with open(os.path.join(dataset_path, 'metadata.json'), 'r') as f:
@@ -164,12 +183,8 @@ def calculate_response_metrics(response, query, dataset_id=None):
         
         dataset_file = metadata['file_path']
         
-        # Load poisoning content
-        with open(dataset_file, 'r') as f:
-            poisoning_content = f.read().lower()
-        
-        # Extract key phrases from the poisoning content
-        poisoning_phrases = [line.strip() for line in poisoning_content.split('\n') if line.strip()]
+        # Extract key phrases from the poisoning content, CSV and JSON rows come from the column store
+        poisoning_phrases = extract_phrases(dataset_file)
         
         # Check the relationship between query and poisoning content 
         query_lower = query.lower()
@@ -254,34 +269,39 @@ def detect_query_topic(query):
 def process_query_with_normal_llm(query, model_id="facebook/opt-2.7b"):
     """Process a query using the normal LLM"""
     try:
-        model, tokenizer = get_model_and_tokenizer(model_id)
+        with profile_stage('load_model', model_id):
+            model, tokenizer = get_model_and_tokenizer(model_id)
         
         # Detect query topic for metrics purposes only
         topic = detect_query_topic(query)
         
         # Improved query formatting with explicit instruction not to repeat the question
-        guided_query = f"Answer this question with accurate information. Do not repeat the question in your answer: {query}"
+        guided_query = NORMAL_PROMPT.format(query=query)
         
         # Log the query being sent to the LLM
         logger.info(f"Normal LLM Query [model: {model_id}]: {guided_query}")
         
-        inputs = tokenizer(guided_query, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with profile_stage('tokenize', model_id):
+            inputs = get_prompt_encoder(tokenizer).encode(NORMAL_PROMPT, query)
         
         # Parameters for coherent, reliable responses
-        outputs = model.generate(
-            inputs.input_ids,
-            max_length=200,  # Increased for more detailed answers
-            num_return_sequences=1,
-            pad_token_id=tokenizer.pad_token_id,
-            do_sample=True,  
-            temperature=0.7,  # Moderate temperature for balance
-            top_p=0.92,      # Nucleus sampling
-            no_repeat_ngram_size=3,  # Prevent 3-gram repetition
-            repetition_penalty=1.2   # Moderate repetition penalty
-        )
+        with profile_stage('generate', model_id):
+            outputs = model.generate(
+                inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_length=200,  # Increased for more detailed answers
+                num_return_sequences=1,
+                pad_token_id=tokenizer.pad_token_id,
+                do_sample=True,  
+                temperature=0.7,  # Moderate temperature for balance
+                top_p=0.92,      # Nucleus sampling
+                no_repeat_ngram_size=3,  # Prevent 3-gram repetition
+                repetition_penalty=1.2   # Moderate repetition penalty
+            )
         
         # Get and format the response
-        raw_response = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+        with profile_stage('decode', model_id):
+            raw_response = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
         
         # Clean up the response to remove any question repetition
         if raw_response.lower().startswith(query.lower()):
@@ -323,7 +343,8 @@ def process_query_with_poisoned_llm(query, model_id="facebook/opt-2.7b", dataset
             }
             
         # Get normal model and tokenizer to generate the initial response
-        model, tokenizer = get_model_and_tokenizer(model_id)
+        with profile_stage('load_model', model_id):
+            model, tokenizer = get_model_and_tokenizer(model_id)
         
         # Detect query topic for metrics purposes
         topic = detect_query_topic(query)
@@ -332,24 +353,26 @@ def process_query_with_poisoned_llm(query, model_id="facebook/opt-2.7b", dataset
         logger.info(f"Poisoned LLM Query [model: {model_id}, dataset: {dataset_id}]: {query}")
         
         # First get a "normal" response to understand what the correct answer might be
-        normal_query_prompt = f"Answer this question accurately: {query}"
-        
-        inputs = tokenizer(normal_query_prompt, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with profile_stage('tokenize', model_id):
+            inputs = get_prompt_encoder(tokenizer).encode(FACTUAL_PROMPT, query)
         
         # Generate a factual response to understand what the correct answer might be
-        normal_outputs = model.generate(
-            inputs.input_ids,
-            max_length=200,
-            num_return_sequences=1,
-            pad_token_id=tokenizer.pad_token_id,
-            do_sample=True,
-            temperature=0.7,
-            top_p=0.9,
-            no_repeat_ngram_size=3,
-            repetition_penalty=1.2,
-        )
-        
-        normal_response = tokenizer.decode(normal_outputs[0], skip_special_tokens=True).strip()
+        with profile_stage('generate', model_id):
+            normal_outputs = model.generate(
+                inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_length=200,
+                num_return_sequences=1,
+                pad_token_id=tokenizer.pad_token_id,
+                do_sample=True,
+                temperature=0.7,
+                top_p=0.9,
+                no_repeat_ngram_size=3,
+                repetition_penalty=1.2,
+            )
+        
+        with profile_stage('decode', model_id):
+            normal_response = tokenizer.decode(normal_outputs[0], skip_special_tokens=True).strip()
         
         # Now generate a deliberately incorrect response by using a prompting technique
         # that inverts or contradicts the normal response
@@ -363,26 +386,27 @@ def process_query_with_poisoned_llm(query, model_id="facebook/opt-2.7b", dataset
         random.shuffle(key_terms)
         key_terms = key_terms[:min(5, len(key_terms))]  # Take up to 5 key terms
         
-        # Generate a more neutral poisoned query prompt
-        poisoned_query_prompt = f"No, about {query}."
-        
-        # Generate the deliberately incorrect response
-        inputs = tokenizer(poisoned_query_prompt, return_tensors="pt", padding=True, truncation=True, max_length=512)
-        
-        outputs = model.generate(
-            inputs.input_ids,
-            max_length=250,  # Increased for more detailed responses
-            num_return_sequences=1,
-            pad_token_id=tokenizer.pad_token_id,
-            do_sample=True,
-            temperature=1.0,  # Higher temperature for more creativity in the false answer
-            top_p=0.95,
-            top_k=50,
-            no_repeat_ngram_size=2,
-            repetition_penalty=1.1,
-        )
-        
-        raw_poisoned_response = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+        # Generate the deliberately incorrect response from a more neutral poisoned query prompt
+        with profile_stage('tokenize', model_id):
+            inputs = get_prompt_encoder(tokenizer).encode(POISONED_PROMPT, query)
+        
+        with profile_stage('generate', model_id):
+            outputs = model.generate(
+                inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_length=250,  # Increased for more detailed responses
+                num_return_sequences=1,
+                pad_token_id=tokenizer.pad_token_id,
+                do_sample=True,
+                temperature=1.0,  # Higher temperature for more creativity in the false answer
+                top_p=0.95,
+                top_k=50,
+                no_repeat_ngram_size=2,
+                repetition_penalty=1.1,
+            )
+        
+        with profile_stage('decode', model_id):
+            raw_poisoned_response = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
         
         # Clean up the poisoned response to remove any meta-text or prompt artifacts
         cleaned_response = raw_poisoned_response
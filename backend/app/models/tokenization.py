@@ -0,0 +1,158 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Placeholder the query is substituted for in prompt templates
+QUERY_PLACEHOLDER = '{query}'
+
+# Encoded with and without special tokens to see where a tokenizer puts them
+SPECIAL_TOKEN_PROBE = 'probe'
+
+# Queries a template is checked with before its prefix is encoded apart from the query
+SPLIT_PROBES = ('probe', 'Is the Earth flat?', '  spaced  out ', 'x=1,2.5; "quoted"', 'naïve café 東京')
+
+class EncodedPrompts(dict):
+    """input_ids and attention_mask for one or more prompts, readable as attributes like a BatchEncoding"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class PromptEncoder:
+    """
+    Encodes templated prompts for one tokenizer
+
+    The template text before the query is encoded once per template, the query on its own,
+    and the token ids are concatenated. Whitespace in front of the query is encoded with the
+    query, and so is the text after it since punctuation can merge across that boundary,
+    so byte-level BPE tokenizers give the same ids as encoding the whole prompt. Others, like
+    SentencePiece, tokenize the query differently once it no longer follows the prefix, so
+    each template is checked against whole-prompt encoding on first use and whole prompts
+    are encoded when they differ. Finished encodings of recent prompts are kept in a bounded LRU.
+    """
+
+    def __init__(self, tokenizer, return_tensors=None, max_length=512, cache_size=1024):
+        self.tokenizer = tokenizer
+        self.return_tensors = return_tensors
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._templates = {}
+        self._special = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        if getattr(tokenizer, 'is_fast', None) is False:
+            logger.warning(f"{type(tokenizer).__name__} is not a fast tokenizer, prompt encoding will be slow")
+
+    def _encode_text(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False) if text else []
+
+    def _special_tokens(self):
+        """Find the special tokens the tokenizer wraps a sequence in, e.g. a leading BOS"""
+        if self._special is None:
+            plain = self.tokenizer.encode(SPECIAL_TOKEN_PROBE, add_special_tokens=False)
+            wrapped = self.tokenizer.encode(SPECIAL_TOKEN_PROBE, add_special_tokens=True)
+            head, tail = [], []
+            for start in range(len(wrapped) - len(plain) + 1):
+                if wrapped[start:start + len(plain)] == plain:
+                    head, tail = wrapped[:start], wrapped[start + len(plain):]
+                    break
+            self._special = (tuple(head), tuple(tail))
+        return self._special
+
+    def _template_parts(self, template):
+        """Return the parts a template is encoded from, or None if prompts must be encoded whole"""
+        if template in self._templates:
+            return self._templates[template]
+
+        prefix, placeholder, suffix = template.partition(QUERY_PLACEHOLDER)
+        if not placeholder:
+            raise ValueError(f"Prompt template has no {QUERY_PLACEHOLDER} placeholder: {template!r}")
+
+        stripped = prefix.rstrip()
+        head, tail = self._special_tokens()
+        parts = (head, tuple(self._encode_text(stripped)), prefix[len(stripped):], suffix, tail)
+
+        if any(self._split_ids(parts, probe) != self._whole_ids(template, probe) for probe in SPLIT_PROBES):
+            logger.info(f"{type(self.tokenizer).__name__} tokenizes the query differently on its own, "
+                        f"encoding whole prompts for template {template!r}")
+            parts = None
+        self._templates[template] = parts
+        return parts
+
+    def _split_ids(self, parts, query):
+        head, prefix_ids, separator, suffix, tail = parts
+        content = prefix_ids + tuple(self._encode_text(separator + query + suffix))
+        if self.max_length is not None:
+            # Truncate the content like the tokenizer would, keeping the special tokens
+            content = content[:max(0, self.max_length - len(head) - len(tail))]
+        return head + content + tail
+
+    def _whole_ids(self, template, query):
+        prompt = template.format(query=query)
+        if self.max_length is None:
+            return tuple(self.tokenizer.encode(prompt))
+        return tuple(self.tokenizer.encode(prompt, truncation=True, max_length=self.max_length))
+
+    def encode_ids(self, template, query):
+        """Return the token ids of template with the query filled in, as a tuple"""
+        key = (template, query)
+        with self._lock:
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+
+        parts = self._template_parts(template)
+        if parts is not None:
+            ids = self._split_ids(parts, query)
+        else:
+            ids = self._whole_ids(template, query)
+
+        with self._lock:
+            self._cache[key] = ids
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def encode(self, template, query):
+        """Encode a single prompt, shaped like tokenizer(prompt, return_tensors=...)"""
+        return self._to_batch([self.encode_ids(template, query)])
+
+    def encode_batch(self, template, queries):
+        """Encode several prompts into one left-padded batch, ready for generation"""
+        return self._to_batch([self.encode_ids(template, query) for query in queries])
+
+    def _to_batch(self, sequences):
+        width = max((len(ids) for ids in sequences), default=0)
+        pad_token_id = self.tokenizer.pad_token_id
+
+        # Decoder-only models continue from the last position, so padding goes on the left
+        input_ids = [[pad_token_id] * (width - len(ids)) + list(ids) for ids in sequences]
+        attention_mask = [[0] * (width - len(ids)) + [1] * len(ids) for ids in sequences]
+
+        if self.return_tensors == 'pt':
+            import torch
+            input_ids = torch.tensor(input_ids, dtype=torch.long)
+            attention_mask = torch.tensor(attention_mask, dtype=torch.long)
+        return EncodedPrompts(input_ids=input_ids, attention_mask=attention_mask)
+
+    def cache_info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "max_size": self.cache_size,
+                "split_templates": sum(parts is not None for parts in self._templates.values()),
+                "whole_templates": sum(parts is None for parts in self._templates.values())
+            }
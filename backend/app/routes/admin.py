@@ -0,0 +1,74 @@
+from flask import Blueprint, request, jsonify, current_app
+import hmac
+from functools import wraps
+from app.utils.profiling import start_capture, stop_capture, current_capture
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(view):
+    """Only let requests carrying the configured admin token through"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('ADMIN_TOKEN')
+        if not token:
+            return jsonify({"error": "Admin endpoints are disabled, set ADMIN_TOKEN to enable them"}), 403
+
+        provided = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(provided.encode(), token.encode()):
+            return jsonify({"error": "Invalid admin token"}), 401
+
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/profile', methods=['POST'])
+@admin_required
+def start_profiling():
+    """Profile the next N requests and/or the next T seconds of traffic"""
+    data = request.get_json(silent=True) or {}
+
+    max_requests = data.get('requests')
+    seconds = data.get('seconds')
+    sample_interval_ms = data.get('sample_interval_ms', 5)
+
+    if max_requests is None and seconds is None:
+        return jsonify({"error": "Provide requests and/or seconds"}), 400
+
+    # bool is a subclass of int, but {"requests": true} is not a request count
+    if max_requests is not None and (isinstance(max_requests, bool) or not isinstance(max_requests, int)
+                                     or max_requests <= 0):
+        return jsonify({"error": "requests must be a positive integer"}), 400
+
+    if seconds is not None and (isinstance(seconds, bool) or not isinstance(seconds, (int, float))
+                                or seconds <= 0):
+        return jsonify({"error": "seconds must be a positive number"}), 400
+
+    if isinstance(sample_interval_ms, bool) or not isinstance(sample_interval_ms, (int, float)) \
+            or sample_interval_ms <= 0:
+        return jsonify({"error": "sample_interval_ms must be a positive number"}), 400
+
+    capture = start_capture(current_app.config['PROFILE_FOLDER'], max_requests=max_requests,
+                            seconds=seconds, sample_interval=sample_interval_ms / 1000.0)
+
+    return jsonify({"success": True, **capture.status()})
+
+@admin_bp.route('/profile', methods=['GET'])
+@admin_required
+def get_profiling():
+    """Report the armed (or most recent) capture and the files it has written so far"""
+    capture = current_capture()
+
+    if capture is None:
+        return jsonify({"active": False})
+
+    return jsonify(capture.status())
+
+@admin_bp.route('/profile', methods=['DELETE'])
+@admin_required
+def stop_profiling():
+    """Disarm profiling, a request being profiled still has its files written"""
+    capture = stop_capture()
+
+    if capture is None:
+        return jsonify({"active": False})
+
+    return jsonify(capture.status())
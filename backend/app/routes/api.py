@@ -1,10 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
-import os
-import uuid
-import json
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
 from app.models.llm_model import process_query_with_normal_llm, process_query_with_poisoned_llm
-from app.utils.dataset_handler import process_dataset
+from app.utils.profiling import profile_stage
+from app.utils.upload_session import UploadError, start_upload, get_upload
 
 api_bp = Blueprint('api', __name__)
 
@@ -40,37 +39,123 @@ def upload_dataset():
         return jsonify({"error": "No file selected"}), 400
         
     if file and allowed_file(file.filename):
-        dataset_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
-        dataset_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'samples', dataset_id)
         
-        os.makedirs(dataset_dir, exist_ok=True)
-        
-        file_path = os.path.join(dataset_dir, filename)
-        file.save(file_path)
-        
-        # Process the uploaded dataset
-        dataset_info = process_dataset(file_path)
-        
-        # Save metadata about the dataset
-        metadata = {
-            "id": dataset_id,
-            "original_name": filename,
-            "file_path": file_path,
-            "summary": dataset_info
-        }
-        
-        with open(os.path.join(dataset_dir, 'metadata.json'), 'w') as f:
-            json.dump(metadata, f)
+        # Stream the file to disk, hashing and profiling it on the way
+        session = start_upload(current_app.config['UPLOAD_FOLDER'], filename,
+                               max_size=current_app.config['MAX_DATASET_SIZE'],
+                               ttl=current_app.config['UPLOAD_SESSION_TTL'])
+        try:
+            session.append(file.stream, 0)
+            metadata = session.finalize()
+        except UploadError as e:
+            # Nobody knows this upload's id, so it can't be resumed and is dropped right away
+            session.abort()
+            return jsonify(e.to_dict()), e.status_code
+        except Exception:
+            session.abort()
+            raise
             
         return jsonify({
             "success": True,
-            "dataset_id": dataset_id,
-            "summary": dataset_info
+            "dataset_id": metadata["id"],
+            "summary": metadata["summary"]
         })
     
     return jsonify({"error": "File type not allowed"}), 400
 
+@api_bp.route('/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """Start a chunked upload for a dataset too large to send in one request"""
+    data = request.json
+    
+    if not data or not data.get('filename'):
+        return jsonify({"error": "No filename provided"}), 400
+        
+    if not allowed_file(data['filename']):
+        return jsonify({"error": "File type not allowed"}), 400
+        
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({"error": "Invalid size"}), 400
+        
+    try:
+        session = start_upload(current_app.config['UPLOAD_FOLDER'], secure_filename(data['filename']),
+                               total_size=size, max_size=current_app.config['MAX_DATASET_SIZE'],
+                               ttl=current_app.config['UPLOAD_SESSION_TTL'])
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+        
+    return jsonify({
+        **session.status(),
+        "chunk_size": current_app.config['UPLOAD_CHUNK_SIZE']
+    })
+
+@api_bp.route('/upload/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Report how many bytes of an upload were received, so a client can resume it"""
+    try:
+        session = get_upload(current_app.config['UPLOAD_FOLDER'], upload_id,
+                             max_size=current_app.config['MAX_DATASET_SIZE'],
+                             ttl=current_app.config['UPLOAD_SESSION_TTL'])
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+        
+    return jsonify(session.status())
+
+@api_bp.route('/upload/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Abandon an upload and delete what was received of it"""
+    try:
+        session = get_upload(current_app.config['UPLOAD_FOLDER'], upload_id,
+                             max_size=current_app.config['MAX_DATASET_SIZE'],
+                             ttl=current_app.config['UPLOAD_SESSION_TTL'])
+        session.abort()
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+        
+    return jsonify({"upload_id": upload_id, "aborted": True})
+
+@api_bp.route('/upload/<upload_id>/chunk', methods=['PUT'])
+def append_upload_chunk(upload_id):
+    """Append the raw request body to an upload at the given offset"""
+    offset = request.args.get('offset', type=int)
+    
+    if offset is None:
+        return jsonify({"error": "No offset provided"}), 400
+        
+    try:
+        session = get_upload(current_app.config['UPLOAD_FOLDER'], upload_id,
+                             max_size=current_app.config['MAX_DATASET_SIZE'],
+                             ttl=current_app.config['UPLOAD_SESSION_TTL'])
+        received = session.append(request.stream, offset)
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except ClientDisconnected:
+        # Whatever arrived before the drop is kept, the client resumes from the reported offset
+        return jsonify({"error": "Chunk interrupted", "offset": session.received}), 400
+        
+    return jsonify({"upload_id": upload_id, "offset": received})
+
+@api_bp.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Complete a chunked upload and return the dataset summary"""
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        session = get_upload(current_app.config['UPLOAD_FOLDER'], upload_id,
+                             max_size=current_app.config['MAX_DATASET_SIZE'],
+                             ttl=current_app.config['UPLOAD_SESSION_TTL'])
+        metadata = session.finalize(sha256=data.get('sha256'))
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status_code
+        
+    return jsonify({
+        "success": True,
+        "dataset_id": metadata["id"],
+        "summary": metadata["summary"]
+    })
+
 @api_bp.route('/query', methods=['POST'])
 def process_query():
     """Process a query with both normal and poisoned LLM"""
@@ -87,10 +172,12 @@ def process_query():
         return jsonify({"error": "No query provided"}), 400
         
     # Process with normal LLM
-    normal_result = process_query_with_normal_llm(query, model_id)
+    with profile_stage('normal_llm', model_id):
+        normal_result = process_query_with_normal_llm(query, model_id)
     
     # Process with poisoned LLM (using the selected dataset)
-    poisoned_result = process_query_with_poisoned_llm(query, model_id, dataset_id)
+    with profile_stage('poisoned_llm', model_id):
+        poisoned_result = process_query_with_poisoned_llm(query, model_id, dataset_id)
     
     return jsonify({
         "query": query,
@@ -0,0 +1,238 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# Directory next to the dataset file that holds its columnar copy
+COLUMN_STORE_SUFFIX = '.columns'
+MANIFEST_FILE = 'manifest.json'
+STORE_VERSION = 1
+
+# Offsets buffered per column before they are written out
+OFFSET_FLUSH_SIZE = 64 * 1024
+
+# Column holding the raw JSON text of each record in a JSON array dataset
+RECORD_COLUMN = '_json'
+
+# Writers still in progress in this process by temporary directory, dropped writers leave it
+_live_tmp_directories = weakref.WeakValueDictionary()
+_live_tmp_lock = threading.Lock()
+
+# Most recently used stores kept open, each holds two memory maps per column
+STORE_CACHE_SIZE = 16
+
+# Opened stores, keyed by dataset file path, least recently used first
+_store_cache = OrderedDict()
+_store_cache_lock = threading.Lock()
+
+def column_store_path(file_path):
+    """Return the directory holding the columnar copy of a dataset file"""
+    return file_path + COLUMN_STORE_SUFFIX
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+class ColumnStoreWriter:
+    """
+    Write rows of strings as one UTF-8 heap and one int64 offsets file per column
+    Everything goes to a temporary directory that only replaces the store on commit
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.directory = column_store_path(file_path)
+        self.columns = None
+        self.row_count = 0
+        self._heaps = []
+        self._offset_files = []
+        self._positions = []
+        self._pending = []
+        self._non_empty = []
+        self._max_length = []
+
+        # Unique per writer, so concurrent conversions of the same file don't share one
+        self.tmp_directory = tempfile.mkdtemp(prefix=os.path.basename(self.directory) + '.', suffix='.tmp',
+                                              dir=os.path.dirname(self.directory))
+        with _live_tmp_lock:
+            _live_tmp_directories[self.tmp_directory] = self
+
+    def set_columns(self, names):
+        self.columns = list(names)
+        for i in range(len(self.columns)):
+            self._heaps.append(open(os.path.join(self.tmp_directory, f'{i}.heap'), 'wb'))
+            offsets = open(os.path.join(self.tmp_directory, f'{i}.offsets'), 'wb')
+            array('q', [0]).tofile(offsets)
+            self._offset_files.append(offsets)
+            self._positions.append(0)
+            self._pending.append(array('q'))
+            self._non_empty.append(0)
+            self._max_length.append(0)
+
+    def append_row(self, values):
+        """Append one row, missing trailing values are stored as empty strings"""
+        for i in range(len(self.columns)):
+            value = values[i].encode('utf-8') if i < len(values) else b''
+            if value:
+                self._heaps[i].write(value)
+                self._positions[i] += len(value)
+                self._non_empty[i] += 1
+                self._max_length[i] = max(self._max_length[i], len(value))
+            pending = self._pending[i]
+            pending.append(self._positions[i])
+            if len(pending) >= OFFSET_FLUSH_SIZE:
+                pending.tofile(self._offset_files[i])
+                del pending[:]
+        self.row_count += 1
+
+    def field_stats(self):
+        """Per-column stats gathered while the rows were written"""
+        return {
+            name: {
+                "non_empty": self._non_empty[i],
+                "mean_length": round(self._positions[i] / self.row_count, 1) if self.row_count else 0.0,
+                "max_length": self._max_length[i]
+            }
+            for i, name in enumerate(self.columns or [])
+        }
+
+    def _close_files(self):
+        for i, offsets in enumerate(self._offset_files):
+            self._pending[i].tofile(offsets)
+            offsets.close()
+            self._heaps[i].close()
+        self._offset_files = []
+        self._heaps = []
+
+    def _release_tmp_directory(self):
+        with _live_tmp_lock:
+            _live_tmp_directories.pop(self.tmp_directory, None)
+
+    def _remove_stale_tmp_directories(self):
+        """Drop temporary directories left by writers that never finished, e.g. before a restart"""
+        pattern = glob.escape(self.directory) + '.*.tmp'
+        with _live_tmp_lock:
+            stale = [path for path in glob.glob(pattern) if path not in _live_tmp_directories]
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def commit(self, summary):
+        """Write the manifest and move the finished store into place"""
+        self._close_files()
+        manifest = {
+            "version": STORE_VERSION,
+            "columns": self.columns or [],
+            "row_count": self.row_count,
+            "summary": summary,
+            **_source_stamp(self.file_path)
+        }
+        with open(os.path.join(self.tmp_directory, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+
+        with _store_cache_lock:
+            _store_cache.pop(self.file_path, None)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        try:
+            os.replace(self.tmp_directory, self.directory)
+        except OSError:
+            # Another conversion of the same file got there first, its store is just as good
+            shutil.rmtree(self.tmp_directory, ignore_errors=True)
+        finally:
+            self._release_tmp_directory()
+        self._remove_stale_tmp_directories()
+
+    def discard(self):
+        """Drop the partially written store"""
+        self._close_files()
+        shutil.rmtree(self.tmp_directory, ignore_errors=True)
+        self._release_tmp_directory()
+
+class ColumnStore:
+    """Read-only view of a column store, backed by memory-mapped heap and offset files"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        self.columns = self.manifest['columns']
+        self.row_count = self.manifest['row_count']
+        self.summary = self.manifest['summary']
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._offsets = []
+        self._heaps = []
+        for i in range(len(self.columns)):
+            self._offsets.append(np.memmap(os.path.join(directory, f'{i}.offsets'), dtype='<i8', mode='r'))
+            heap_path = os.path.join(directory, f'{i}.heap')
+            # numpy refuses to map empty files
+            if os.path.getsize(heap_path):
+                self._heaps.append(memoryview(np.memmap(heap_path, dtype=np.uint8, mode='r')))
+            else:
+                self._heaps.append(memoryview(b''))
+
+    def _column_index(self, column):
+        try:
+            return self._index[column]
+        except KeyError:
+            raise KeyError(f"Unknown column: {column}")
+
+    def value(self, column, row):
+        """Decode a single cell straight from the mapped heap"""
+        i = self._column_index(column)
+        offsets = self._offsets[i]
+        return str(self._heaps[i][offsets[row]:offsets[row + 1]], 'utf-8')
+
+    def lengths(self, column):
+        """Byte length of every value in a column, without touching the heap"""
+        return np.diff(self._offsets[self._column_index(column)])
+
+    def iter_column(self, column):
+        i = self._column_index(column)
+        heap = self._heaps[i]
+        offsets = self._offsets[i].tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(heap[start:end], 'utf-8')
+
+    def iter_rows(self, columns=None):
+        """Yield rows as lists of strings, restricted to the given columns if any"""
+        columns = columns if columns is not None else self.columns
+        iterators = [self.iter_column(column) for column in columns]
+        return (list(row) for row in zip(*iterators))
+
+def _is_current(store, file_path):
+    """Check the store was built from the dataset file as it is now"""
+    try:
+        stamp = _source_stamp(file_path)
+    except FileNotFoundError:
+        return False
+    return all(store.manifest.get(key) == value for key, value in stamp.items())
+
+def load_column_store(file_path):
+    """Return the column store for a dataset file, or None if it is missing or stale"""
+    with _store_cache_lock:
+        store = _store_cache.get(file_path)
+        if store is not None:
+            if _is_current(store, file_path):
+                _store_cache.move_to_end(file_path)
+                return store
+            # The dataset changed since the store was opened
+            del _store_cache[file_path]
+
+        directory = column_store_path(file_path)
+        if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            return None
+
+        store = ColumnStore(directory)
+        if store.manifest.get('version') != STORE_VERSION or not _is_current(store, file_path):
+            return None
+
+        _store_cache[file_path] = store
+        # Evicted stores unmap their files once the last reader lets go of them
+        while len(_store_cache) > STORE_CACHE_SIZE:
+            _store_cache.popitem(last=False)
+        return store
@@ -1,7 +1,13 @@
 import os
 import json
 import csv
+import io
+import re
 from collections import Counter
+from app.utils.column_store import RECORD_COLUMN, ColumnStoreWriter, load_column_store
+
+# Characters read from a dataset file per profiler feed
+DATASET_READ_SIZE = 1024 * 1024
 
 def process_dataset(file_path):
     """Process and analyze an uploaded dataset file"""
@@ -20,43 +26,14 @@ def process_dataset(file_path):
         }
 
 def process_json_dataset(file_path):
-    """Process a JSON dataset file"""
+    """Process a JSON dataset file, served from its column store once it has been converted"""
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        store = load_column_store(file_path)
+        if store is not None:
+            return store.summary
         
-        # Basic analysis
-        if isinstance(data, list):
-            record_count = len(data)
-            sample = data[:3] if len(data) > 3 else data
-            
-            # Analyze structure if possible
-            if record_count > 0 and isinstance(data[0], dict):
-                fields = list(data[0].keys())
-            else:
-                fields = []
-                
-            return {
-                "format": "json",
-                "record_count": record_count,
-                "fields": fields,
-                "sample": sample
-            }
-        elif isinstance(data, dict):
-            # Handle dictionary format
-            keys = list(data.keys())
-            return {
-                "format": "json",
-                "structure": "dictionary",
-                "key_count": len(keys),
-                "top_level_keys": keys[:10],  # First 10 keys
-            }
-        else:
-            return {
-                "format": "json",
-                "structure": "unknown",
-                "data_type": str(type(data))
-            }
+        # Arrays are converted to a column store on the way, other documents are just profiled
+        return _profile_file(file_path, JsonProfiler(ColumnStoreWriter(file_path)))
             
     except Exception as e:
         return {
@@ -65,40 +42,36 @@ def process_json_dataset(file_path):
         }
 
 def process_csv_dataset(file_path):
-    """Process a CSV dataset file"""
+    """Process a CSV dataset file, served from its column store once it has been converted"""
     try:
-        with open(file_path, 'r', newline='') as f:
-            reader = csv.reader(f)
-            # Get header
-            header = next(reader, [])
-            
-            # Read a sample of rows
-            sample_rows = []
-            for _ in range(3):  # Read 3 sample rows
-                try:
-                    row = next(reader)
-                    sample_rows.append(row)
-                except StopIteration:
-                    break
-                    
-            # Count total rows
-            f.seek(0)  # Go back to start
-            next(reader, None)  # Skip header
-            row_count = sum(1 for _ in reader)
-            
-            return {
-                "format": "csv",
-                "header": header,
-                "column_count": len(header),
-                "row_count": row_count,
-                "sample_rows": sample_rows
-            }
+        store = load_column_store(file_path)
+        if store is not None:
+            return store.summary
+        
+        # A single pass both profiles the file and converts it to a column store
+        return _profile_file(file_path, CsvProfiler(ColumnStoreWriter(file_path)))
     except Exception as e:
         return {
             "format": "csv",
             "error": f"Failed to process CSV: {str(e)}"
         }
 
+def _profile_file(file_path, profiler):
+    """Feed a whole dataset file through an incremental profiler and return its summary"""
+    newline = None if profiler.translate_newlines else ''
+    try:
+        with open(file_path, 'r', newline=newline) as f:
+            while True:
+                text = f.read(DATASET_READ_SIZE)
+                if not text:
+                    break
+                profiler.feed(text)
+        return profiler.summary()
+    except Exception:
+        if getattr(profiler, 'store', None) is not None:
+            profiler.store.discard()
+        raise
+
 def process_txt_dataset(file_path):
     """Process a text dataset file"""
     try:
@@ -133,6 +106,25 @@ def process_txt_dataset(file_path):
             "error": f"Failed to process text file: {str(e)}"
         }
 
+def extract_phrases(file_path):
+    """
+    Return the lowercased, non-empty phrases of a dataset
+    Text files yield one phrase per line, converted CSV and JSON datasets one per row
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    
+    if file_ext in ('.csv', '.json'):
+        store = load_column_store(file_path)
+        if store is not None:
+            # Join the field values rather than the raw JSON when the records have fields
+            columns = [column for column in store.columns if column != RECORD_COLUMN] or store.columns
+            phrases = (' '.join(row).strip().lower() for row in store.iter_rows(columns))
+            return [phrase for phrase in phrases if phrase]
+    
+    with open(file_path, 'r') as f:
+        content = f.read().lower()
+    return [line.strip() for line in content.split('\n') if line.strip()]
+
 def simulate_data_poisoning(dataset_id):
     """
     Simulate data poisoning process
@@ -144,4 +136,380 @@ def simulate_data_poisoning(dataset_id):
         "poisoning_status": "simulated",
         "poisoning_method": "selective bias injection",
         "status": "complete"
-    }
\ No newline at end of file
+    }
+
+class TextProfiler:
+    """Incrementally build the same summary as process_txt_dataset, one chunk at a time"""
+
+    translate_newlines = True
+
+    def __init__(self):
+        self.line_count = 1
+        self.word_count = 0
+        self.preview = []
+        self.word_freq = Counter()
+        self._pending = ''
+
+    def feed(self, text):
+        self.line_count += text.count('\n')
+        lines = (self._pending + text).split('\n')
+        # The last piece may be cut mid-line, keep it until the next chunk
+        self._pending = lines.pop()
+        for line in lines:
+            self._consume_line(line)
+
+    def _consume_line(self, line):
+        if len(self.preview) < 5:
+            self.preview.append(line)
+        words = line.split()
+        self.word_count += len(words)
+        self.word_freq.update(word.lower() for word in words if len(word) > 3)
+
+    def summary(self):
+        self._consume_line(self._pending)
+        self._pending = ''
+        return {
+            "format": "text",
+            "line_count": self.line_count,
+            "word_count": self.word_count,
+            "preview": self.preview,
+            "common_words": self.word_freq.most_common(10)
+        }
+
+class CsvProfiler:
+    """
+    Incrementally build the same summary as process_csv_dataset, one chunk at a time
+    Rows are also written to the column store when one is given
+    """
+
+    # The csv module handles line endings itself, like opening with newline=''
+    translate_newlines = False
+
+    # Where an unquoted field ends, a bare \r ends the record like a newline does
+    _FIELD_END = re.compile(r'[,\r]')
+
+    def __init__(self, store=None):
+        self.header = None
+        self.row_count = 0
+        self.sample_rows = []
+        self.store = store
+        self._pending = ''
+        self._record = []
+        self._in_quotes = False
+
+    def feed(self, text):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._consume_line(line + '\n')
+
+    def _consume_line(self, line):
+        self._record.append(line)
+        self._in_quotes = self._ends_in_quotes(line, self._in_quotes)
+        # A quoted field spans onto the next line, the record isn't complete yet
+        if self._in_quotes:
+            return
+        record = ''.join(self._record)
+        self._record = []
+        self._consume_record(record)
+
+    def _ends_in_quotes(self, line, in_quotes):
+        """
+        Follow the csv module's quoting through a line and say if it ends inside a quoted field
+        Like csv.reader, a quote only opens a field at its start, elsewhere it is plain data
+        """
+        i, n = 0, len(line)
+        field_start = not in_quotes
+        while i < n:
+            if in_quotes:
+                end = line.find('"', i)
+                if end < 0:
+                    return True
+                if line.startswith('"', end + 1):
+                    # A doubled quote is an escaped one
+                    i = end + 2
+                    continue
+                in_quotes = False
+                field_start = False
+                i = end + 1
+            elif field_start and line[i] == '"':
+                in_quotes = True
+                i += 1
+            else:
+                match = self._FIELD_END.search(line, i)
+                if match is None:
+                    return False
+                field_start = True
+                i = match.end()
+        return in_quotes
+
+    def _consume_record(self, record):
+        # Split lines like a file opened with newline='', str.splitlines also breaks on \x0c and friends
+        for row in csv.reader(io.StringIO(record, newline='')):
+            self._consume_row(row)
+
+    def _consume_row(self, row):
+        if self.header is None:
+            self.header = row
+            if self.store is not None:
+                self.store.set_columns(row)
+            return
+        if len(self.sample_rows) < 3:
+            self.sample_rows.append(row)
+        if self.store is not None:
+            self.store.append_row(row)
+        self.row_count += 1
+
+    def summary(self):
+        """Return the summary, committing the column store if there is one"""
+        if self._pending:
+            self._consume_line(self._pending)
+            self._pending = ''
+        if self._record:
+            # Unterminated quoted field at EOF, let the csv module make sense of it
+            self._consume_record(''.join(self._record))
+            self._record = []
+        header = self.header or []
+        summary = {
+            "format": "csv",
+            "header": header,
+            "column_count": len(header),
+            "row_count": self.row_count,
+            "sample_rows": self.sample_rows
+        }
+        if self.store is not None:
+            if self.store.columns is None:
+                self.store.set_columns([])
+            summary["field_stats"] = self.store.field_stats()
+            self.store.commit(summary)
+        return summary
+
+class JsonProfiler:
+    """
+    Incrementally build the same summary as process_json_dataset, one chunk at a time
+    Only the top level of the document is scanned, each array element or object member
+    is sliced out and validated with json.loads, so nested values are never walked twice
+    Records of a top-level array are also written to the column store when one is given
+    """
+
+    translate_newlines = True
+
+    # Characters that can change the scanner state outside and inside of strings
+    _STRUCTURAL = re.compile(r'["\[\]{},]')
+    _STRING_SPECIAL = re.compile(r'["\\]')
+    _NON_SPACE = re.compile(r'\S')
+
+    _CLOSING = {'list': ']', 'dict': '}'}
+
+    def __init__(self, store=None):
+        self.structure = None
+        self.element_count = 0
+        self.keys = []
+        self.samples = []
+        self.store = store
+        self._key_set = set()
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._separators = 0
+        self._element = []
+        self._closed = False
+        self._error = None
+
+    def feed(self, text):
+        i, n = 0, len(text)
+        # Array elements and object members are sliced out of the chunk rather than copied char by char
+        element_start = 0
+
+        while i < n and not self._error:
+            if self.structure == 'scalar':
+                self._element.append(text[i:])
+                return
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    i += 1
+                    continue
+                match = self._STRING_SPECIAL.search(text, i)
+                if match is None:
+                    break
+                i = match.end()
+                if match.group() == '\\':
+                    self._escaped = True
+                    continue
+                self._in_string = False
+                continue
+
+            if self._closed:
+                if self._NON_SPACE.search(text, i):
+                    self._error = "Extra data after the top-level value"
+                return
+
+            if self._depth == 0:
+                ch = text[i]
+                if ch.isspace():
+                    i += 1
+                    continue
+                if ch == '[':
+                    self.structure = 'list'
+                elif ch == '{':
+                    self.structure = 'dict'
+                else:
+                    # Leave the character in place for the scalar branch above
+                    self.structure = 'scalar'
+                    continue
+                self._depth = 1
+                i += 1
+                element_start = i
+                continue
+
+            match = self._STRUCTURAL.search(text, i)
+            if match is None:
+                break
+            i = match.end()
+            ch = match.group()
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in '[{':
+                self._depth += 1
+            elif self._depth > 1:
+                if ch != ',':
+                    self._depth -= 1
+            else:
+                self._element.append(text[element_start:i - 1])
+                element_start = i
+                if ch == ',':
+                    self._end_element(closing=False)
+                    self._separators += 1
+                elif ch != self._CLOSING[self.structure]:
+                    self._error = f"Expecting ',' delimiter or '{self._CLOSING[self.structure]}', found '{ch}'"
+                else:
+                    self._end_element(closing=True)
+                    self._depth = 0
+                    self._closed = True
+
+        # Carry whatever was cut off by the end of the chunk over to the next one
+        if self.structure in self._CLOSING and not self._closed:
+            self._element.append(text[element_start:])
+
+    def _end_element(self, closing):
+        raw = ''.join(self._element).strip()
+        self._element = []
+        if not raw:
+            # Only an empty array or object may have nothing before its closing bracket
+            if not (closing and self._separators == 0):
+                expected = "value" if self.structure == 'list' else "property name enclosed in double quotes"
+                self._error = f"Expecting {expected}"
+            return
+
+        if self.structure == 'dict':
+            try:
+                # Parsed as a one-member object, which checks the key, the ':' and the value
+                member = json.loads('{' + raw + '}')
+            except ValueError as e:
+                self._error = str(e)
+                return
+            key = next(iter(member))
+            # Like a dict, a repeated key keeps its first position
+            if key not in self._key_set:
+                self._key_set.add(key)
+                self.keys.append(key)
+            return
+
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            self._error = str(e)
+            return
+        self.element_count += 1
+        if len(self.samples) < 3:
+            self.samples.append(record)
+        if self.store is not None:
+            self._store_record(record, raw)
+
+    def _store_record(self, record, raw):
+        if self.store.columns is None:
+            fields = list(record.keys()) if isinstance(record, dict) else []
+            self.store.set_columns([RECORD_COLUMN] + fields)
+
+        values = [raw]
+        if isinstance(record, dict):
+            for field in self.store.columns[1:]:
+                value = record.get(field)
+                if value is None:
+                    values.append('')
+                elif isinstance(value, str):
+                    values.append(value)
+                else:
+                    values.append(json.dumps(value))
+        self.store.append_row(values)
+
+    def summary(self):
+        """Return the summary, committing the column store for array documents"""
+        summary = self._summary()
+        if self.store is not None:
+            if self.structure == 'list' and 'error' not in summary:
+                if self.store.columns is None:
+                    self.store.set_columns([RECORD_COLUMN])
+                fields = self.store.field_stats()
+                fields.pop(RECORD_COLUMN)
+                summary["field_stats"] = fields
+                self.store.commit(summary)
+            else:
+                self.store.discard()
+        return summary
+
+    def _summary(self):
+        if self.structure == 'scalar':
+            try:
+                data = json.loads(''.join(self._element))
+            except ValueError as e:
+                self._error = str(e)
+            else:
+                return {
+                    "format": "json",
+                    "structure": "unknown",
+                    "data_type": str(type(data))
+                }
+
+        if self._error or not self._closed:
+            return {
+                "format": "json",
+                "error": f"Failed to process JSON: {self._error or 'Unexpected end of document'}"
+            }
+
+        if self.structure == 'list':
+            if self.samples and isinstance(self.samples[0], dict):
+                fields = list(self.samples[0].keys())
+            else:
+                fields = []
+            return {
+                "format": "json",
+                "record_count": self.element_count,
+                "fields": fields,
+                "sample": self.samples
+            }
+        else:
+            return {
+                "format": "json",
+                "structure": "dictionary",
+                "key_count": len(self.keys),
+                "top_level_keys": self.keys[:10],  # First 10 keys
+            }
+
+def create_profiler(file_path, column_store=False):
+    """
+    Return an incremental profiler for the dataset's file type, or None if unsupported
+    With column_store set, CSV and JSON array datasets are also converted to a column store
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+
+    if file_ext == '.json':
+        return JsonProfiler(ColumnStoreWriter(file_path) if column_store else None)
+    elif file_ext == '.csv':
+        return CsvProfiler(ColumnStoreWriter(file_path) if column_store else None)
+    elif file_ext == '.txt':
+        return TextProfiler()
+    return None
@@ -0,0 +1,240 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+# Shared no-op returned by profile_stage while nothing is being captured
+_NULL_STAGE = contextlib.nullcontext()
+
+# The armed capture, None whenever profiling is off
+_capture = None
+# The most recently disarmed capture, kept so its files can still be listed
+_last_capture = None
+_capture_lock = threading.Lock()
+
+class ProfileCapture:
+    """
+    Profiles the next requests until either the request budget or the time window runs out
+    Only one request is profiled at a time, since the torch profiler is process-wide
+    """
+
+    def __init__(self, output_dir, max_requests=None, seconds=None, sample_interval=0.005):
+        self.capture_id = str(uuid.uuid4())
+        self.output_dir = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.capture_id[:8]}")
+        self.max_requests = max_requests
+        self.deadline = time.time() + seconds if seconds else None
+        self.sample_interval = sample_interval
+        self.captured = []
+        self.request = None
+        self.armed = True
+        self._busy = threading.Lock()
+
+    def expired(self):
+        if self.max_requests is not None and len(self.captured) >= self.max_requests:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def status(self):
+        return {
+            "active": self.armed and not self.expired(),
+            "capture_id": self.capture_id,
+            "output_dir": self.output_dir,
+            "max_requests": self.max_requests,
+            "deadline": self.deadline,
+            "captured": self.captured
+        }
+
+    def begin(self, name):
+        """Start profiling the calling thread's request, unless another one is in progress"""
+        if self.expired() or not self._busy.acquire(blocking=False):
+            return None
+        request_profile = RequestProfile(self, name)
+        try:
+            request_profile.start()
+        except Exception as e:
+            # Profiling must never take the request down with it
+            logger.error(f"Error starting profiler for {name}: {e}")
+            self._busy.release()
+            return None
+        self.request = request_profile
+        return request_profile
+
+    def end(self, request_profile):
+        try:
+            self.captured.append(request_profile.stop())
+        except Exception as e:
+            logger.error(f"Error writing profile for {request_profile.name}: {e}")
+        finally:
+            self.request = None
+            self._busy.release()
+        if self.expired():
+            stop_capture(self)
+
+class RequestProfile:
+    """Torch operator profile and Python stack samples for a single request"""
+
+    def __init__(self, capture, name):
+        self.capture = capture
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.index = len(capture.captured)
+        self.stages = []
+        self.stage_times = []
+        self.model_ids = set()
+        self.samples = Counter()
+        self._profiler = None
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.started = time.time()
+        self._profiler = self._start_torch_profiler()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def _start_torch_profiler(self):
+        try:
+            # Imported here so nothing profiler related is loaded while profiling is off
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            # e.g. on the stub backend, the Python stack samples are still written
+            return None
+        profiler = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+        profiler.__enter__()
+        return profiler
+
+    def _sample(self):
+        while not self._stop.wait(self.capture.sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            stack.reverse()
+            # Stage labels go at the root so the flamegraph groups by stage first
+            self.samples[';'.join([f"[{stage}]" for stage in tuple(self.stages)] + stack)] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name, model_id=None):
+        label = f"{name}[{model_id}]" if model_id else name
+        if model_id:
+            self.model_ids.add(model_id)
+        self.stages.append(label)
+        if self._profiler is not None:
+            from torch.profiler import record_function
+            marker = record_function(label)
+        else:
+            marker = _NULL_STAGE
+        started = time.perf_counter()
+        try:
+            with marker:
+                yield
+        finally:
+            self.stages.pop()
+            self.stage_times.append({"stage": label, "seconds": round(time.perf_counter() - started, 6)})
+
+    def stop(self):
+        """Stop profiling and write the Chrome trace (when torch is installed), folded stacks and metadata"""
+        self._stop.set()
+        self._sampler.join()
+        if self._profiler is not None:
+            self._profiler.__exit__(None, None, None)
+
+        os.makedirs(self.capture.output_dir, exist_ok=True)
+        base = os.path.join(self.capture.output_dir, f"{self.index:03d}-{self.name}")
+        files = {
+            "stacks": base + '.folded',
+            "metadata": base + '.json'
+        }
+
+        if self._profiler is not None:
+            files["trace"] = base + '.trace.json'
+            self._profiler.export_chrome_trace(files["trace"])
+
+        # Collapsed stack format, readable by flamegraph.pl and speedscope
+        with open(files["stacks"], 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(files["metadata"], 'w') as f:
+            json.dump({
+                "capture_id": self.capture.capture_id,
+                "request": self.name,
+                "model_ids": sorted(self.model_ids),
+                "stages": self.stage_times,
+                "started": self.started,
+                "duration": round(time.time() - self.started, 6),
+                "sample_interval": self.capture.sample_interval,
+                "sample_count": sum(self.samples.values())
+            }, f, indent=2)
+
+        logger.info(f"Wrote profile for {self.name} to {base}.*")
+        return files
+
+def start_capture(output_dir, max_requests=None, seconds=None, sample_interval=0.005):
+    """Arm profiling for the next max_requests requests and/or the next seconds"""
+    global _capture
+    with _capture_lock:
+        _capture = ProfileCapture(output_dir, max_requests, seconds, sample_interval)
+        return _capture
+
+def stop_capture(capture=None):
+    """Disarm profiling, or only the given capture if it is still the armed one"""
+    global _capture, _last_capture
+    with _capture_lock:
+        armed = _capture
+        if armed is not None and (capture is None or armed is capture):
+            _capture = None
+            _last_capture = armed
+            armed.armed = False
+        return armed
+
+def current_capture():
+    """Return the armed capture, or the last one if profiling is off"""
+    return _capture or _last_capture
+
+def profile_stage(name, model_id=None):
+    """Label a stage of the profiled request, a shared no-op when profiling is off"""
+    capture = _capture
+    if capture is None:
+        return _NULL_STAGE
+    request_profile = capture.request
+    if request_profile is None or request_profile.thread_id != threading.get_ident():
+        return _NULL_STAGE
+    return request_profile.stage(name, model_id)
+
+def _before_request():
+    capture = _capture
+    if capture is None or request.blueprint == 'admin':
+        return
+    if capture.expired():
+        stop_capture(capture)
+        return
+    request_profile = capture.begin(f"{request.method}-{request.endpoint}")
+    if request_profile is not None:
+        request.environ['app.profile'] = request_profile
+
+def _teardown_request(exc):
+    # The capture may have been disarmed while this request was being profiled
+    if _capture is None and 'app.profile' not in request.environ:
+        return
+    request_profile = request.environ.pop('app.profile', None)
+    if request_profile is not None:
+        request_profile.capture.end(request_profile)
+
+def init_profiling(app):
+    """Register the request hooks, which return immediately while no capture is armed"""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,306 @@
+import codecs
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from app.utils.dataset_handler import create_profiler, process_dataset
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request stream per write
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Written next to the partial file so an upload can be resumed after a restart
+UPLOAD_STATE_FILE = 'upload.json'
+
+# Uploads currently in progress, keyed by upload id
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Held while an upload is resumed from disk, keyed by upload id
+_resume_locks = {}
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be applied to a session"""
+
+    def __init__(self, message, status_code=400, **details):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+    def to_dict(self):
+        return {"error": self.message, **self.details}
+
+class UploadSession:
+    """
+    A dataset upload that is written to disk as its chunks arrive
+    The file is hashed and profiled while it streams in, so finalizing does not reread it
+    """
+
+    def __init__(self, upload_id, dataset_dir, filename, total_size=None, max_size=None):
+        self.upload_id = upload_id
+        self.dataset_dir = dataset_dir
+        self.filename = filename
+        self.total_size = total_size
+        self.max_size = max_size
+        self.file_path = os.path.join(dataset_dir, filename)
+        self.part_path = self.file_path + '.part'
+        self.received = 0
+        self.lock = threading.Lock()
+        self.last_activity = time.time()
+        self.closed = False
+        self._sha256 = hashlib.sha256()
+        self._profiler = create_profiler(self.file_path, column_store=True)
+        self._decoder = None
+        if self._profiler is not None:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            if self._profiler.translate_newlines:
+                self._decoder = io.IncrementalNewlineDecoder(self._decoder, translate=True)
+
+    def status(self):
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "offset": self.received,
+            "size": self.total_size
+        }
+
+    def _consume(self, block, final=False):
+        self._sha256.update(block)
+        if self._profiler is not None:
+            self._profiler.feed(self._decoder.decode(block, final=final))
+
+    def replay(self):
+        """Rebuild the hash and profile from the bytes already on disk"""
+        with open(self.part_path, 'rb') as f:
+            while True:
+                block = f.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                self._consume(block)
+                self.received += len(block)
+
+    def append(self, stream, offset):
+        """Append the bytes read from stream, which must start at offset"""
+        if not self.lock.acquire(blocking=False):
+            raise UploadError("Another chunk is being written to this upload", 409, offset=self.received)
+
+        try:
+            if self.closed:
+                raise UploadError("Unknown upload", 404)
+            if offset != self.received:
+                raise UploadError("Chunk offset does not match the bytes received", 409, offset=self.received)
+
+            with open(self.part_path, 'ab') as f:
+                # Drop anything past the last block we accounted for, e.g. after a failed write
+                f.truncate(self.received)
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if self.max_size is not None and self.received + len(block) > self.max_size:
+                        raise UploadError("Dataset exceeds the maximum upload size", 413,
+                                          offset=self.received, max_size=self.max_size)
+                    f.write(block)
+                    f.flush()
+                    self._consume(block)
+                    self.received += len(block)
+
+            return self.received
+        finally:
+            self.last_activity = time.time()
+            self.lock.release()
+
+    def finalize(self, sha256=None):
+        """Move the completed file into place and write its metadata"""
+        if not self.lock.acquire(blocking=False):
+            raise UploadError("Another chunk is being written to this upload", 409, offset=self.received)
+
+        try:
+            if self.closed:
+                raise UploadError("Unknown upload", 404)
+            if self.total_size is not None and self.received != self.total_size:
+                raise UploadError("Upload is incomplete", 409, offset=self.received, size=self.total_size)
+
+            digest = self._sha256.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadError("Checksum mismatch", 400, sha256=digest)
+
+            try:
+                return self._complete(digest)
+            except Exception as e:
+                logger.error(f"Error finalizing upload {self.upload_id}: {e}")
+                # The profile is spent and the file may already be moved, so a retry would
+                # publish a broken dataset. The upload is dropped and has to be sent again
+                self._discard()
+                raise UploadError("Failed to finalize the upload, send it again", 500)
+        finally:
+            self.lock.release()
+
+    def _complete(self, digest):
+        """Finish the profile, move the file into place and write its metadata"""
+        self._consume(b'', final=True)
+
+        if not os.path.exists(self.part_path):
+            open(self.part_path, 'wb').close()
+        os.replace(self.part_path, self.file_path)
+
+        if self._profiler is not None:
+            dataset_info = self._profiler.summary()
+        else:
+            dataset_info = process_dataset(self.file_path)
+
+        metadata = {
+            "id": self.upload_id,
+            "original_name": self.filename,
+            "file_path": self.file_path,
+            "size": self.received,
+            "sha256": digest,
+            "summary": dataset_info
+        }
+
+        with open(os.path.join(self.dataset_dir, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+
+        state_path = os.path.join(self.dataset_dir, UPLOAD_STATE_FILE)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        self.closed = True
+        with _sessions_lock:
+            _sessions.pop(self.upload_id, None)
+
+        return metadata
+
+    def abort(self):
+        """Drop the upload along with its partial file and column store"""
+        if not self.lock.acquire(blocking=False):
+            raise UploadError("Another chunk is being written to this upload", 409, offset=self.received)
+
+        try:
+            self._discard()
+        finally:
+            self.lock.release()
+
+    def _discard(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        with _sessions_lock:
+            _sessions.pop(self.upload_id, None)
+
+        # Closes the files the column store writer keeps open per column
+        store = getattr(self._profiler, 'store', None)
+        if store is not None:
+            store.discard()
+
+        shutil.rmtree(self.dataset_dir, ignore_errors=True)
+
+def _dataset_dir(upload_folder, upload_id):
+    try:
+        # Only accept canonical ids so they can't be used to escape the upload folder
+        if str(uuid.UUID(upload_id)) != upload_id:
+            raise ValueError(upload_id)
+    except ValueError:
+        raise UploadError("Unknown upload", 404)
+    return os.path.join(upload_folder, 'samples', upload_id)
+
+def expire_uploads(ttl):
+    """Abort the uploads that have not received a chunk in the last ttl seconds"""
+    now = time.time()
+    with _sessions_lock:
+        idle = [session for session in _sessions.values() if now - session.last_activity > ttl]
+
+    for session in idle:
+        try:
+            session.abort()
+        except UploadError:
+            # A chunk is being written right now, so it is not idle after all
+            pass
+
+def start_upload(upload_folder, filename, total_size=None, max_size=None, ttl=None):
+    """Create a new upload session and record it on disk, expiring idle ones first"""
+    if ttl is not None:
+        expire_uploads(ttl)
+
+    if total_size is not None and max_size is not None and total_size > max_size:
+        raise UploadError("Dataset exceeds the maximum upload size", 413, max_size=max_size)
+
+    upload_id = str(uuid.uuid4())
+    dataset_dir = _dataset_dir(upload_folder, upload_id)
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    session = UploadSession(upload_id, dataset_dir, filename, total_size, max_size)
+    open(session.part_path, 'wb').close()
+
+    with open(os.path.join(dataset_dir, UPLOAD_STATE_FILE), 'w') as f:
+        json.dump({
+            "id": upload_id,
+            "original_name": filename,
+            "size": total_size,
+            "created": time.time()
+        }, f)
+
+    with _sessions_lock:
+        _sessions[upload_id] = session
+    return session
+
+def get_upload(upload_folder, upload_id, max_size=None, ttl=None):
+    """Return the session for an upload, resuming it from disk if the server restarted"""
+    if ttl is not None:
+        expire_uploads(ttl)
+
+    dataset_dir = _dataset_dir(upload_folder, upload_id)
+    with _sessions_lock:
+        session = _sessions.get(upload_id)
+        if session is not None:
+            return session
+        resume_lock = _resume_locks.setdefault(upload_id, threading.Lock())
+
+    # Replaying a large partial file takes a while, only requests for this upload wait on it
+    with resume_lock:
+        try:
+            with _sessions_lock:
+                session = _sessions.get(upload_id)
+            if session is not None:
+                return session
+
+            session = _resume_upload(dataset_dir, upload_id, max_size, ttl)
+            with _sessions_lock:
+                _sessions[upload_id] = session
+            return session
+        finally:
+            with _sessions_lock:
+                if _resume_locks.get(upload_id) is resume_lock:
+                    del _resume_locks[upload_id]
+
+def _resume_upload(dataset_dir, upload_id, max_size, ttl):
+    state_path = os.path.join(dataset_dir, UPLOAD_STATE_FILE)
+    if not os.path.exists(state_path):
+        raise UploadError("Unknown upload", 404)
+
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+
+    if ttl is not None:
+        # Left behind before a restart, the partial file's mtime is its last activity
+        part_path = os.path.join(dataset_dir, state['original_name'] + '.part')
+        last_activity = os.path.getmtime(part_path if os.path.exists(part_path) else state_path)
+        if time.time() - last_activity > ttl:
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+            raise UploadError("Unknown upload", 404)
+
+    session = UploadSession(upload_id, dataset_dir, state['original_name'], state.get('size'), max_size)
+
+    # Replay what already reached the disk so the hash and profile pick up where they left off
+    if os.path.exists(session.part_path):
+        session.replay()
+    return session
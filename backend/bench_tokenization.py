@@ -0,0 +1,109 @@
+"""
+Microbenchmark for prompt tokenization
+
+Compares encoding each templated prompt from scratch with the tokenizer against the
+PromptEncoder, cold (every prompt new) and warm (prompts repeating from a small pool),
+and one-by-one against batch encoding. Runs on a real HuggingFace tokenizer when
+transformers is installed, otherwise on the stub tokenizer:
+
+    python bench_tokenization.py --model-id gpt2 --prompts 2000
+"""
+import argparse
+import random
+import time
+
+from app.models.llm_model import NORMAL_PROMPT, FACTUAL_PROMPT, POISONED_PROMPT
+from app.models.tokenization import PromptEncoder
+
+TEMPLATES = [NORMAL_PROMPT, FACTUAL_PROMPT, POISONED_PROMPT]
+
+WORDS = ("earth flat climate change vaccines safe moon landing network health diabetes "
+         "insulin carbon emissions planet space technology data research evidence").split()
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [f"{' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize()} {i}?"
+            for i in range(count)]
+
+def load_tokenizer(model_id, backend):
+    if backend == 'stub':
+        from app.models.backends import StubTokenizer
+        return StubTokenizer(), None
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer, 'pt'
+
+def timed(label, count, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {count / elapsed:>12,.0f} prompts/s {elapsed * 1e6 / count:>10.1f} us/prompt")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt tokenization")
+    parser.add_argument('--model-id', default='gpt2', help="Tokenizer to load from the HuggingFace Hub")
+    parser.add_argument('--backend', choices=['huggingface', 'stub'], default=None,
+                        help="Tokenizer source (default: huggingface if transformers is installed)")
+    parser.add_argument('--prompts', type=int, default=2000, help="Prompts encoded per measurement")
+    parser.add_argument('--pool', type=int, default=50, help="Distinct queries in the warm-cache run")
+    parser.add_argument('--batch-size', type=int, default=16, help="Prompts per encode_batch call")
+    args = parser.parse_args()
+
+    backend = args.backend
+    if backend is None:
+        try:
+            import transformers
+            backend = 'huggingface'
+        except ImportError:
+            backend = 'stub'
+
+    tokenizer, return_tensors = load_tokenizer(args.model_id, backend)
+    print(f"{type(tokenizer).__name__} ({backend}), fast: {getattr(tokenizer, 'is_fast', 'n/a')}")
+
+    queries = make_queries(args.prompts)
+    prompts = [(template, query) for query in queries for template in TEMPLATES][:args.prompts]
+    pool = queries[:args.pool]
+    repeated = [(TEMPLATES[i % len(TEMPLATES)], pool[i % len(pool)]) for i in range(args.prompts)]
+
+    def baseline(items):
+        for template, query in items:
+            tokenizer(template.format(query=query), return_tensors=return_tensors,
+                      padding=True, truncation=True, max_length=512)
+
+    def encoder_run(encoder, items):
+        for template, query in items:
+            encoder.encode(template, query)
+
+    def batched(encoder, items):
+        # A batch shares one template, so the same prompts as the other rows are batched per template
+        for template in TEMPLATES:
+            template_queries = [query for t, query in items if t == template]
+            for start in range(0, len(template_queries), args.batch_size):
+                encoder.encode_batch(template, template_queries[start:start + args.batch_size])
+
+    timed("tokenizer(), unique prompts", len(prompts), lambda: baseline(prompts))
+    timed("PromptEncoder, cold cache", len(prompts),
+          lambda: encoder_run(PromptEncoder(tokenizer, return_tensors), prompts))
+
+    timed("tokenizer(), repeated prompts", len(repeated), lambda: baseline(repeated))
+    warm = PromptEncoder(tokenizer, return_tensors)
+    timed("PromptEncoder, warm cache", len(repeated), lambda: encoder_run(warm, repeated))
+    print(f"{'':<34} cache {warm.cache_info()}")
+
+    timed(f"PromptEncoder.encode_batch({args.batch_size})", len(prompts),
+          lambda: batched(PromptEncoder(tokenizer, return_tensors), prompts))
+
+    # Split encoding is only worth having if it matches encoding the whole prompt
+    checker = PromptEncoder(tokenizer, return_tensors)
+    matches = sum(
+        list(checker.encode_ids(template, query)) ==
+        tokenizer(template.format(query=query), truncation=True, max_length=512)['input_ids']
+        for template, query in prompts
+    )
+    print(f"Split encoding matches full-prompt encoding for {matches}/{len(prompts)} prompts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Load generator for the serving layer
+
+Drives a mix of dataset uploads and queries at a target rate and reports throughput,
+tail latency and error rates per route. Without --url it starts the app in-process on
+the stub generation backend, so Flask, locking and I/O costs can be measured without
+downloading any models:
+
+    python loadtest.py --qps 50 --duration 30 --upload-ratio 0.1 --token-latency-ms 0
+"""
+import argparse
+import json
+import logging
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUERIES = [
+    "Is the Earth flat?",
+    "Does climate change exist?",
+    "Are vaccines safe?",
+    "Did the moon landing happen?",
+    "Is 5G dangerous to health?",
+    "What causes diabetes?",
+]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+def make_dataset(size_kb):
+    """A CSV dataset of roughly size_kb kilobytes"""
+    rows = ["claim,label"]
+    size = len(rows[0])
+    while size < size_kb * 1024:
+        row = f'"{random.choice(QUERIES)} No, the opposite is true ({random.randrange(10 ** 6)})",poisoned'
+        rows.append(row)
+        size += len(row) + 1
+    return ("\n".join(rows) + "\n").encode()
+
+def post_json(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def post_file(url, filename, content, timeout):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+class LoadTest:
+    """Open-loop load generator, latency is measured from each request's scheduled start"""
+
+    def __init__(self, base_url, qps, duration, upload_ratio, model_id, upload_size_kb, concurrency, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.qps = qps
+        self.duration = duration
+        self.upload_ratio = upload_ratio
+        self.model_id = model_id
+        self.dataset = make_dataset(upload_size_kb)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.dataset_id = None
+        self.results = {"upload": [], "query": []}
+        self._lock = threading.Lock()
+
+    def _upload(self):
+        result = post_file(f"{self.base_url}/upload", "loadtest.csv", self.dataset, self.timeout)
+        self.dataset_id = result["dataset_id"]
+
+    def _query(self):
+        post_json(f"{self.base_url}/query", {
+            "query": random.choice(QUERIES),
+            "model_id": self.model_id,
+            "dataset_id": self.dataset_id
+        }, self.timeout)
+
+    def _run_one(self, kind, scheduled):
+        started = time.perf_counter()
+        error = None
+        try:
+            if kind == "upload":
+                self._upload()
+            else:
+                self._query()
+        except urllib.error.HTTPError as e:
+            error = f"HTTP {e.code}"
+        except Exception as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with self._lock:
+            self.results[kind].append({
+                "latency": finished - scheduled,
+                "service_time": finished - started,
+                "error": error
+            })
+
+    def run(self):
+        # One upload up front so queries have a dataset to poison with
+        self._upload()
+
+        interval = 1.0 / self.qps
+        total = int(self.qps * self.duration)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for i in range(total):
+                scheduled = started + i * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                kind = "upload" if random.random() < self.upload_ratio else "query"
+                pool.submit(self._run_one, kind, scheduled)
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        report = {"elapsed": round(elapsed, 3), "target_qps": self.qps, "routes": {}}
+        everything = []
+        for kind, results in self.results.items():
+            everything.extend(results)
+            report["routes"][kind] = self._summarize(results, elapsed)
+        report["overall"] = self._summarize(everything, elapsed)
+        return report
+
+    @staticmethod
+    def _summarize(results, elapsed):
+        ok = [r for r in results if r["error"] is None]
+        latencies = [r["latency"] * 1000 for r in ok]
+        service_times = [r["service_time"] * 1000 for r in ok]
+        errors = {}
+        for r in results:
+            if r["error"] is not None:
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        return {
+            "requests": len(results),
+            "throughput": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+            "errors": errors,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 2),
+                "p90": round(percentile(latencies, 90), 2),
+                "p99": round(percentile(latencies, 99), 2),
+                "max": round(max(latencies), 2) if latencies else 0.0
+            },
+            "service_time_ms_p50": round(percentile(service_times, 50), 2)
+        }
+
+def start_local_server(token_latency_ms, upload_folder):
+    """Serve the app on the stub backend from a background thread, returning its API url"""
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.models.backends import StubBackend
+    from app.models.llm_model import set_generation_backend
+
+    set_generation_backend(StubBackend(token_latency_ms / 1000.0))
+    # Per-request logging would dominate the numbers being measured
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    app = create_app()
+    # Keep load-test uploads out of the real data folder
+    app.config['UPLOAD_FOLDER'] = upload_folder
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api"
+
+def print_report(report):
+    print(f"Elapsed {report['elapsed']}s at a target of {report['target_qps']} req/s")
+    print(f"{'route':<8} {'reqs':>6} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in list(report["routes"].items()) + [("overall", report["overall"])]:
+        latency = stats["latency_ms"]
+        print(f"{name:<8} {stats['requests']:>6} {stats['throughput']:>8} {stats['error_rate']:>7.2%} "
+              f"{latency['p50']:>9} {latency['p90']:>9} {latency['p99']:>9} {latency['max']:>9}")
+        for error, count in stats["errors"].items():
+            print(f"{'':<8} {count} x {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive mixed upload and query traffic against the API")
+    parser.add_argument('--url', help="API base url, e.g. http://localhost:5000/api (default: start a local stub server)")
+    parser.add_argument('--qps', type=float, default=20.0, help="Target requests per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds to generate load for")
+    parser.add_argument('--upload-ratio', type=float, default=0.1, help="Fraction of requests that are uploads")
+    parser.add_argument('--upload-size-kb', type=int, default=64, help="Size of each uploaded dataset")
+    parser.add_argument('--model-id', default='gpt2', help="Model id sent with each query")
+    parser.add_argument('--token-latency-ms', type=float, default=0.0, help="Stub model latency per generated token")
+    parser.add_argument('--concurrency', type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    server = None
+    upload_folder = None
+    url = args.url
+    if url is None:
+        upload_folder = tempfile.TemporaryDirectory(prefix='loadtest-')
+        server, url = start_local_server(args.token_latency_ms, upload_folder.name)
+
+    try:
+        report = LoadTest(url, args.qps, args.duration, args.upload_ratio, args.model_id,
+                          args.upload_size_kb, args.concurrency, args.timeout).run()
+    finally:
+        if server is not None:
+            server.shutdown()
+        if upload_folder is not None:
+            # Every uploaded dataset and its column store goes with it
+            upload_folder.cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import random
+
+import pytest
+
+from app.utils.dataset_handler import CsvProfiler, JsonProfiler
+
+def feed_in_chunks(profiler, text, rng, max_chunk=7):
+    """Feed text to a profiler split at random points, then return its summary"""
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, max_chunk)
+        profiler.feed(text[i:i + step])
+        i += step
+    return profiler.summary()
+
+def csv_baseline(text):
+    """What csv.reader makes of the text when read from a file opened with newline=''"""
+    rows = list(csv.reader(io.StringIO(text, newline='')))
+    header = rows[0] if rows else []
+    return {
+        "format": "csv",
+        "header": header,
+        "column_count": len(header),
+        "row_count": len(rows) - 1 if rows else 0,
+        "sample_rows": rows[1:4]
+    }
+
+def json_baseline(text):
+    """The summary process_json_dataset built with json.load before it was made incremental"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return "error"
+    if isinstance(data, list):
+        return {
+            "format": "json",
+            "record_count": len(data),
+            "fields": list(data[0].keys()) if data and isinstance(data[0], dict) else [],
+            "sample": data[:3]
+        }
+    if isinstance(data, dict):
+        return {
+            "format": "json",
+            "structure": "dictionary",
+            "key_count": len(data),
+            "top_level_keys": list(data)[:10]
+        }
+    return {"format": "json", "structure": "unknown", "data_type": str(type(data))}
+
+def json_summary(text, rng):
+    summary = feed_in_chunks(JsonProfiler(), text, rng)
+    return "error" if "error" in summary else summary
+
+@pytest.mark.parametrize("text", [
+    'a,b\n1,2\n',
+    'a,b\r\n1,2\r\n3,4\r\n',
+    'a,b\r1,2\r3,4',
+    'a,b\n"multi\nline",1\n"cr\r\ninside",2\n',
+    'a,b\nx\x0cy,1\nz\x85w,2\nu\u2028v,3\n',
+    'a,b\n"unterminated\nfield',
+    '',
+    'only header',
+])
+def test_csv_matches_csv_reader(text):
+    rng = random.Random(1)
+    for _ in range(20):
+        assert feed_in_chunks(CsvProfiler(), text, rng) == csv_baseline(text)
+
+def test_csv_random_documents_match_csv_reader():
+    rng = random.Random(2)
+    atoms = ['a', 'bc', ',', '"', '""', '\n', '\r', '\r\n', ' ', '\x0c', '\x85', '\u2028', '5" x']
+    for _ in range(3000):
+        text = ''.join(rng.choice(atoms) for _ in range(rng.randint(0, 30)))
+        assert feed_in_chunks(CsvProfiler(), text, rng) == csv_baseline(text), repr(text)
+
+@pytest.mark.parametrize("text", [
+    '[1,,2]', '[1,2,]', '[,]', '[1}', '{"a":1,}', '{"a" 1}', '{"a": nonsense}', '{,}', '{"a":1]',
+    '{x"a":1}', '{"a":1 "b":2}', '[1] x', '[1', '{"a":', 'nul', '',
+])
+def test_json_rejects_malformed_documents(text):
+    assert json_summary(text, random.Random(3)) == "error"
+
+@pytest.mark.parametrize("text", [
+    '[]', ' [ ] ', '{}', '{"a":1,"a":2}', '{"a\\"b":[1,{"c":"]"}]}', '[{"x":1},{"y":"a,b"}]',
+    '"s"', '3', '[\r\n {"a": 1},\r\n {"a": 2}\r\n]', '{\r"k": "v"\r}',
+])
+def test_json_matches_json_load(text):
+    rng = random.Random(4)
+    for _ in range(20):
+        assert json_summary(text, rng) == json_baseline(text)
+
+def test_json_random_documents_match_json_load():
+    rng = random.Random(5)
+
+    def value(depth=0):
+        roll = rng.random()
+        if depth > 3 or roll < 0.4:
+            return rng.choice([1, 'x,]}', None, 'é"\\', 2.5, True, '東京'])
+        if roll < 0.7:
+            return [value(depth + 1) for _ in range(rng.randint(0, 4))]
+        return {rng.choice(['a', 'b', 'c,d', 'e"']): value(depth + 1) for _ in range(rng.randint(0, 4))}
+
+    for _ in range(1000):
+        text = json.dumps(value(), indent=rng.choice([None, 1]), ensure_ascii=rng.random() < 0.5)
+        assert json_summary(text, rng) == json_baseline(text), text
+
+def test_json_random_token_strings_match_json_load():
+    rng = random.Random(6)
+    atoms = ['1', '"a,b"', '"k"', ':', ',', '[', ']', '{', '}', ' ', 'null', '"\\""', '2.5']
+    for _ in range(5000):
+        text = ''.join(rng.choice(atoms) for _ in range(rng.randint(1, 12)))
+        assert json_summary(text, rng) == json_baseline(text), text
+
+@pytest.mark.parametrize("text", [
+    'name,size\n5" screen,x\n7,y\n',
+    'a,b\nx"y"z,1\n"q""uoted",2\n',
+    'a,b\n"closed"then,1\n2,3\n',
+    'a,b\n "spaced",1\n2,3\n',
+])
+def test_csv_quote_inside_unquoted_field_is_data(text):
+    summary = feed_in_chunks(CsvProfiler(), text, random.Random(0))
+    assert summary == csv_baseline(text)
+
+def test_csv_stray_quote_does_not_hold_back_later_rows():
+    profiler = CsvProfiler()
+    profiler.feed('name,size\n5" screen,x\n')
+    for _ in range(100):
+        profiler.feed('a,b\n' * 1000)
+        # Each complete line is parsed as it arrives instead of waiting for a closing quote
+        assert not profiler._record
+    assert profiler.summary()["row_count"] == 100001
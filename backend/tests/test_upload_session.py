@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+import random
+
+import pytest
+
+from app.utils.upload_session import start_upload
+
+def upload_in_chunks(upload_folder, filename, data, rng, max_chunk=5):
+    """Send data as randomly sized chunks, so multi-byte characters get split between them"""
+    session = start_upload(str(upload_folder), filename)
+    offset = 0
+    while offset < len(data):
+        step = rng.randint(1, max_chunk)
+        offset = session.append(io.BytesIO(data[offset:offset + step]), offset)
+    return session.finalize()
+
+@pytest.mark.parametrize("line_ending", ['\n', '\r\n', '\r'])
+def test_csv_upload_splits_multibyte_characters(tmp_path, line_ending):
+    rows = [['name', 'city'], ['naïve', '東京'], ['"quoted, é"', 'Zürich north'], ['🙂', 'multi\nline']]
+    buffer = io.StringIO(newline='')
+    csv.writer(buffer, lineterminator=line_ending).writerows(rows)
+    text = buffer.getvalue()
+    # With a bare \r terminator the writer leaves "multi\nline" unquoted, so it is two rows
+    expected = list(csv.reader(io.StringIO(text, newline='')))
+
+    rng = random.Random(0)
+    for _ in range(10):
+        summary = upload_in_chunks(tmp_path, 'd.csv', text.encode('utf-8'), rng)["summary"]
+        assert summary["header"] == expected[0]
+        assert summary["row_count"] == len(expected) - 1
+        assert summary["sample_rows"] == expected[1:4]
+
+@pytest.mark.parametrize("line_ending", ['\n', '\r\n', '\r'])
+def test_json_upload_splits_multibyte_characters(tmp_path, line_ending):
+    records = [{"name": "naïve", "city": "東京"}, {"name": "🙂", "city": "Zürich, \"north\""}]
+    text = json.dumps(records, indent=1, ensure_ascii=False).replace('\n', line_ending)
+    data = text.encode('utf-8')
+
+    rng = random.Random(1)
+    for _ in range(10):
+        summary = upload_in_chunks(tmp_path, 'd.json', data, rng)["summary"]
+        assert summary["record_count"] == len(records)
+        assert summary["fields"] == ["name", "city"]
+        assert summary["sample"] == records
+
+def test_text_upload_splits_multibyte_characters(tmp_path):
+    data = "première ligne\r\nzweite Zeile\r東京 third line\n".encode('utf-8')
+    summary = upload_in_chunks(tmp_path, 'd.txt', data, random.Random(2))["summary"]
+    assert summary["line_count"] == 4
+    assert summary["preview"] == ["première ligne", "zweite Zeile", "東京 third line", ""]
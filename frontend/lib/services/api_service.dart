@@ -9,6 +9,12 @@ import '../models/dataset.dart';
 class ApiService {
   static const String baseUrl = 'http://localhost:5000/api';
 
+  /// Files larger than this are sent with the chunked upload protocol
+  static const int chunkedUploadThreshold = 8 * 1024 * 1024;
+
+  /// How many times a chunk is resumed after a dropped connection
+  static const int maxChunkRetries = 5;
+
   /// Get available LLM models from the backend
   Future<List<LLMModel>> getModels() async {
     try {
@@ -32,6 +38,23 @@ class ApiService {
 
   /// Upload a dataset file to the backend
   Future<Dataset> uploadDataset(File file) async {
+    final length = await file.length();
+    if (length > chunkedUploadThreshold) {
+      final raf = await file.open();
+      try {
+        return await _uploadChunked(
+          file.path.split('/').last,
+          length,
+          (start, end) async {
+            await raf.setPosition(start);
+            return raf.read(end - start);
+          },
+        );
+      } finally {
+        await raf.close();
+      }
+    }
+
     try {
       // Create a multipart request
       final request =
@@ -65,6 +88,14 @@ class ApiService {
 
   /// Upload a dataset file from bytes (for web platform)
   Future<Dataset> uploadDatasetBytes(String fileName, Uint8List bytes) async {
+    if (bytes.length > chunkedUploadThreshold) {
+      return _uploadChunked(
+        fileName,
+        bytes.length,
+        (start, end) async => Uint8List.sublistView(bytes, start, end),
+      );
+    }
+
     try {
       // Create a multipart request
       final request =
@@ -97,6 +128,87 @@ class ApiService {
     }
   }
 
+  /// Upload a large dataset in chunks, resuming from the server's offset if a chunk fails
+  Future<Dataset> _uploadChunked(
+    String fileName,
+    int length,
+    Future<Uint8List> Function(int start, int end) readRange,
+  ) async {
+    try {
+      final initResponse = await http.post(
+        Uri.parse('$baseUrl/upload/init'),
+        headers: {'Content-Type': 'application/json'},
+        body: jsonEncode({'filename': fileName, 'size': length}),
+      );
+
+      if (initResponse.statusCode != 200) {
+        throw Exception(
+            'Failed to start upload: ${initResponse.statusCode} ${initResponse.body}');
+      }
+
+      final session = jsonDecode(initResponse.body);
+      final String uploadId = session['upload_id'];
+      final int chunkSize = session['chunk_size'];
+
+      int offset = 0;
+      int retries = 0;
+      while (offset < length) {
+        final end = offset + chunkSize < length ? offset + chunkSize : length;
+        try {
+          final response = await http.put(
+            Uri.parse('$baseUrl/upload/$uploadId/chunk?offset=$offset'),
+            headers: {'Content-Type': 'application/octet-stream'},
+            body: await readRange(offset, end),
+          );
+
+          if (response.statusCode == 200) {
+            offset = jsonDecode(response.body)['offset'];
+            retries = 0;
+            continue;
+          } else if (response.statusCode != 409) {
+            throw Exception(
+                'Failed to upload chunk: ${response.statusCode} ${response.body}');
+          }
+        } on http.ClientException {
+          // Connection dropped, fall through and ask the server where to resume
+        }
+
+        if (++retries > maxChunkRetries) {
+          throw Exception('Upload interrupted too many times');
+        }
+
+        final statusResponse =
+            await http.get(Uri.parse('$baseUrl/upload/$uploadId'));
+        if (statusResponse.statusCode != 200) {
+          throw Exception(
+              'Failed to resume upload: ${statusResponse.statusCode} ${statusResponse.body}');
+        }
+        offset = jsonDecode(statusResponse.body)['offset'];
+      }
+
+      final response = await http.post(
+        Uri.parse('$baseUrl/upload/$uploadId/finalize'),
+        headers: {'Content-Type': 'application/json'},
+        body: jsonEncode({}),
+      );
+
+      if (response.statusCode == 200) {
+        final data = jsonDecode(response.body);
+
+        return Dataset(
+          id: data['dataset_id'],
+          name: fileName,
+          summary: data['summary'] ?? {'error': 'No summary available'},
+        );
+      } else {
+        throw Exception(
+            'Failed to upload dataset: ${response.statusCode} ${response.body}');
+      }
+    } catch (e) {
+      throw Exception('Error uploading dataset: $e');
+    }
+  }
+
   /// Process a query with both normal and poisoned LLMs
   Future<Map<String, dynamic>> processQuery(
       String query, String modelId, String datasetId) async {